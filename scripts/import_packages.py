@@ -1,17 +1,47 @@
 import argparse
 import asyncio
-import json
 import os
 import shutil
+from pathlib import Path
 
+import orjson
 import weaviate
 from weaviate.classes.config import DataType, Property
 from weaviate.embedded import EmbeddedOptions
 from weaviate.util import generate_uuid5
 
-from codegate.inference.inference_engine import LlamaCppInferenceEngine
 from codegate.utils.utils import generate_vector_string
 
+# Number of vector strings sent to the embedding model in a single call
+EMBED_BATCH_SIZE = 256
+# Number of objects sent to Weaviate in a single batch request
+WEAVIATE_BATCH_SIZE = 500
+
+# Keep the OpenMP threads used by llama.cpp pinned to cores, so they are not migrated
+# between cores while embedding. The number of threads is left to llama-cpp-python, which
+# defaults to half the logical CPUs, i.e. one thread per physical core on SMT hosts.
+# On multi-socket hosts also bind the whole import to a single NUMA node, e.g.:
+#   numactl --cpunodebind=0 --membind=0 python scripts/import_packages.py
+OMP_ENV_DEFAULTS = {
+    "OMP_PROC_BIND": "close",
+    "OMP_PLACES": "cores",
+}
+
+
+def parse_jsonl_file(json_file):
+    """
+    Parses the packages of a JSONL file, setting their status from the file name.
+    """
+    packages = []
+    # All the packages of a file share the same status, e.g. data/archived.jsonl -> archived
+    status = Path(json_file).stem
+    with open(json_file, "rb") as f:
+        for line in f:
+            package = orjson.loads(line)
+            package["status"] = status
+            packages.append(package)
+    return packages
+
 
 class PackageImporter:
     def __init__(self, jsonl_dir="data", take_backup=True, restore_backup=True):
@@ -34,6 +64,13 @@ class PackageImporter:
             os.path.join(jsonl_dir, "malicious.jsonl"),
         ]
         self.client.connect()
+
+        # The OpenMP runtime reads its settings when llama.cpp is loaded, so they have to be
+        # set before importing the inference engine. Values set by the caller take precedence.
+        for key, value in OMP_ENV_DEFAULTS.items():
+            os.environ.setdefault(key, value)
+        from codegate.inference.inference_engine import LlamaCppInferenceEngine
+
         self.inference_engine = LlamaCppInferenceEngine()
         self.model_path = "./codegate_volume/models/all-minilm-L6-v2-q5_k_m.gguf"
 
@@ -78,49 +115,55 @@ class PackageImporter:
                 ],
             )
 
-    async def process_package(self, batch, package):
-        vector_str = generate_vector_string(package)
-        vector = await self.inference_engine.embed(self.model_path, [vector_str])
-        # This is where the synchronous call is made
-        batch.add_object(properties=package, vector=vector[0])
+    async def embed_packages(self, packages):
+        """
+        Embeds the vector strings of the given packages in batches of EMBED_BATCH_SIZE,
+        returning one vector per package in the same order.
+        """
+        vector_strs = [generate_vector_string(package) for package in packages]
+        vectors = []
+        for start in range(0, len(vector_strs), EMBED_BATCH_SIZE):
+            batch_strs = vector_strs[start : start + EMBED_BATCH_SIZE]
+            vectors.extend(await self.inference_engine.embed(self.model_path, batch_strs))
+        return vectors
 
     async def add_data(self):
         collection = self.client.collections.get("Package")
-        existing_packages = list(collection.iterator())
-        packages_dict = {
-            f"{package.properties['name']}/{package.properties['type']}": {
-                "status": package.properties["status"],
-                "description": package.properties["description"],
-            }
-            for package in existing_packages
+        # Objects are inserted with a UUID derived from all of the package properties, so a
+        # package that is already stored with the same status and description has the same
+        # UUID. Only fetch the UUIDs to find which packages can be skipped.
+        existing_uuids = {
+            str(package.uuid)
+            for package in collection.iterator(include_vector=False, return_properties=[])
         }
 
-        for json_file in self.json_files:
-            with open(json_file, "r") as f:
-                print("Adding data from", json_file)
-                packages_to_insert = []
-                for line in f:
-                    package = json.loads(line)
-                    package["status"] = json_file.split("/")[-1].split(".")[0]
-                    key = f"{package['name']}/{package['type']}"
-
-                    if key in packages_dict and packages_dict[key] == {
-                        "status": package["status"],
-                        "description": package["description"],
-                    }:
-                        print("Package already exists", key)
-                        continue
-
-                    vector_str = generate_vector_string(package)
-                    vector = await self.inference_engine.embed(self.model_path, [vector_str])
-                    packages_to_insert.append((package, vector[0]))
-
-                # Synchronous batch insert after preparing all data
-                with collection.batch.dynamic() as batch:
-                    for package, vector in packages_to_insert:
-                        batch.add_object(
-                            properties=package, vector=vector, uuid=generate_uuid5(package)
-                        )
+        # Parse the files in worker threads so the event loop is not blocked by the parsing
+        parsed_files = await asyncio.gather(
+            *[asyncio.to_thread(parse_jsonl_file, json_file) for json_file in self.json_files]
+        )
+
+        packages_to_insert = []
+        for json_file, packages in zip(self.json_files, parsed_files):
+            print("Adding data from", json_file)
+            for package in packages:
+                uuid = generate_uuid5(package)
+
+                if uuid in existing_uuids:
+                    print("Package already exists", f"{package['name']}/{package['type']}")
+                    continue
+
+                packages_to_insert.append((package, uuid))
+
+        # Embed all the new packages at once instead of one call per package
+        vectors = await self.embed_packages([package for package, _ in packages_to_insert])
+
+        # Synchronous batch insert after preparing all data
+        with collection.batch.fixed_size(
+            batch_size=WEAVIATE_BATCH_SIZE,
+            concurrent_requests=min(8, os.cpu_count() or 1),
+        ) as batch:
+            for (package, uuid), vector in zip(packages_to_insert, vectors):
+                batch.add_object(properties=package, vector=vector, uuid=uuid)
 
     async def run_import(self):
         if self.restore_backup_flag:
@@ -30,8 +30,7 @@ def get_messages(db_reader: DbReader = Depends(get_db_reader)) -> List[Conversat
     """
     Get all the messages from the database and return them as a list of conversations.
     """
-    prompts_outputs = asyncio.run(db_reader.get_prompts_with_output())
-
+    prompts_outputs = db_reader.get_prompts_with_output()
     return asyncio.run(parse_messages_in_conversations(prompts_outputs))
 
 
@@ -40,7 +39,7 @@ def get_alerts(db_reader: DbReader = Depends(get_db_reader)) -> List[AlertConver
     """
     Get all the messages from the database and return them as a list of conversations.
     """
-    alerts_prompt_output = asyncio.run(db_reader.get_alerts_with_prompt_and_output())
+    alerts_prompt_output = db_reader.get_alerts_with_prompt_and_output()
     return asyncio.run(parse_get_alert_conversation(alerts_prompt_output))
 
 
@@ -1,6 +1,6 @@
 import asyncio
 import json
-from typing import List, Optional, Tuple, Union
+from typing import AsyncIterator, List, Optional, Tuple, Union
 
 import structlog
 
@@ -221,15 +221,15 @@ async def match_conversations(
 
 
 async def parse_messages_in_conversations(
-    prompts_outputs: List[GetPromptWithOutputsRow],
+    prompts_outputs: AsyncIterator[GetPromptWithOutputsRow],
 ) -> List[Conversation]:
     """
     Get all the messages from the database and return them as a list of conversations.
     """
 
-    # Parse the prompts and outputs in parallel
+    # Parse the prompts and outputs in parallel, while the rows are still being read
     async with asyncio.TaskGroup() as tg:
-        tasks = [tg.create_task(parse_get_prompt_with_output(row)) for row in prompts_outputs]
+        tasks = [tg.create_task(parse_get_prompt_with_output(row)) async for row in prompts_outputs]
     partial_conversations = [task.result() for task in tasks]
 
     conversations = await match_conversations(partial_conversations)
@@ -275,14 +275,16 @@ async def parse_row_alert_conversation(
 
 
 async def parse_get_alert_conversation(
-    alerts_conversations: List[GetAlertsWithPromptAndOutputRow],
+    alerts_conversations: AsyncIterator[GetAlertsWithPromptAndOutputRow],
 ) -> List[AlertConversation]:
     """
-    Parse a list of rows from the get_alerts_with_prompt_and_output query and return a list of
-    AlertConversation
+    Parse the rows streamed from the get_alerts_with_prompt_and_output query and return a list
+    of AlertConversation
 
     The rows contain the raw request and output strings from the pipeline.
     """
     async with asyncio.TaskGroup() as tg:
-        tasks = [tg.create_task(parse_row_alert_conversation(row)) for row in alerts_conversations]
+        tasks = [
+            tg.create_task(parse_row_alert_conversation(row)) async for row in alerts_conversations
+        ]
     return [task.result() for task in tasks if task.result() is not None]
@@ -1,12 +1,13 @@
 import asyncio
-import json
+import functools
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, TypeVar
 
+import orjson
 import structlog
 from pydantic import BaseModel
-from sqlalchemy import text
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import column, event, insert, table, text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
 
 from codegate.db.fim_cache import FimCache
 from codegate.db.models import Alert, Output, Prompt
@@ -21,6 +22,57 @@ logger = structlog.get_logger("codegate")
 alert_queue = asyncio.Queue()
 fim_cache = FimCache()
 
+T = TypeVar("T")
+
+# Maximum number of queued writes committed together in a single transaction
+MAX_WRITES_PER_COMMIT = 64
+
+# Use WAL so readers don't block the writer and fsync is only needed at checkpoints.
+# synchronous=NORMAL is safe with WAL, a power loss can only roll back the last commits.
+_SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+]
+
+# Lightweight table construct to build INSERTs with SQLAlchemy Core. The columns
+# are left untyped so the values are bound the same way as with the text() queries.
+_alerts_table = table(
+    "alerts",
+    column("id"),
+    column("prompt_id"),
+    column("code_snippet"),
+    column("trigger_string"),
+    column("trigger_type"),
+    column("trigger_category"),
+    column("timestamp"),
+)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply the SQLite PRAGMAs on every new DBAPI connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in _SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+@functools.lru_cache(maxsize=1)
+def _load_schema_statements() -> List[str]:
+    """Read the schema file once and split it into individual statements."""
+    # Get the absolute path to the schema file
+    current_dir = Path(__file__).parent
+    schema_path = current_dir.parent.parent.parent / "sql" / "schema" / "schema.sql"
+
+    if not schema_path.exists():
+        raise FileNotFoundError(f"Schema file not found at {schema_path}")
+
+    schema = schema_path.read_text()
+    return [stmt.strip() for stmt in schema.split(";") if stmt.strip()]
+
 
 class DbCodeGate:
 
@@ -37,13 +89,17 @@ class DbCodeGate:
         engine_dict = {
             "url": f"sqlite+aiosqlite:///{self._db_path}",
             "echo": False,  # Set to False in production
-            "isolation_level": "AUTOCOMMIT",  # Required for SQLite
         }
         self._async_db_engine = create_async_engine(**engine_dict)
+        event.listen(self._async_db_engine.sync_engine, "connect", _set_sqlite_pragmas)
 
     def does_db_exist(self):
         return self._db_path.is_file()
 
+    async def close(self) -> None:
+        """Close the connections of the DB engine."""
+        await self._async_db_engine.dispose()
+
 
 class DbRecorder(DbCodeGate):
 
@@ -52,7 +108,12 @@ class DbRecorder(DbCodeGate):
 
         if not self.does_db_exist():
             logger.info(f"Database does not exist at {self._db_path}. Creating..")
-            asyncio.run(self.init_db())
+            asyncio.run(self._create_schema())
+
+        # The writer task is started lazily, on the event loop of the first write
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._writer_loop: Optional[asyncio.AbstractEventLoop] = None
 
     async def init_db(self):
         """Initialize the database with the schema."""
@@ -60,51 +121,119 @@ class DbRecorder(DbCodeGate):
             logger.info("Database already exists. Skipping initialization.")
             return
 
-        # Get the absolute path to the schema file
-        current_dir = Path(__file__).parent
-        schema_path = current_dir.parent.parent.parent / "sql" / "schema" / "schema.sql"
-
-        if not schema_path.exists():
-            raise FileNotFoundError(f"Schema file not found at {schema_path}")
-
-        # Read the schema
-        with open(schema_path, "r") as f:
-            schema = f.read()
-
+        await self._create_schema()
+
+    async def close(self) -> None:
+        """
+        Stop the writer task and close the connections of the DB engine.
+
+        The recorder can still be used afterwards, the next write starts a new writer.
+        """
+        writer_task = self._writer_task
+        if writer_task is not None and self._writer_loop is asyncio.get_running_loop():
+            writer_task.cancel()
+            # Wait for the writer to fail its pending writes, without raising its cancellation
+            await asyncio.wait([writer_task])
+        self._write_queue = None
+        self._writer_task = None
+        self._writer_loop = None
+        await super().close()
+
+    async def _create_schema(self):
+        """Execute the schema statements on the database."""
+        statements = _load_schema_statements()
+        async with self._async_db_engine.begin() as conn:
+            for statement in statements:
+                # Use SQLAlchemy text() to create executable SQL statements
+                await conn.execute(text(statement))
+
+    async def _write(self, write_fn: Callable[[AsyncConnection], Awaitable[T]]) -> T:
+        """
+        Queue a write for the writer task and wait until it has been committed.
+
+        write_fn receives the connection of the writer's transaction. Writes queued while
+        a transaction is being committed are grouped and committed together in the next one.
+        """
+        loop = asyncio.get_running_loop()
+        # Queues and tasks are bound to their event loop, start a writer for each loop.
+        # Also start a new one if the writer of this loop has stopped, nobody would
+        # read the queue otherwise.
+        if self._writer_loop is not loop or self._writer_task.done():
+            self._write_queue = asyncio.Queue()
+            self._writer_task = loop.create_task(self._drain_writes(self._write_queue))
+            self._writer_loop = loop
+
+        future = loop.create_future()
+        await self._write_queue.put((write_fn, future))
+        return await future
+
+    async def _drain_writes(self, write_queue: asyncio.Queue) -> None:
+        """Execute the queued writes, committing all the available ones in one transaction."""
+        writes = []
         try:
-            # Execute the schema
-            async with self._async_db_engine.begin() as conn:
-                # Split the schema into individual statements and execute each one
-                statements = [stmt.strip() for stmt in schema.split(";") if stmt.strip()]
-                for statement in statements:
-                    # Use SQLAlchemy text() to create executable SQL statements
-                    await conn.execute(text(statement))
+            while True:
+                writes = [await write_queue.get()]
+                while len(writes) < MAX_WRITES_PER_COMMIT and not write_queue.empty():
+                    writes.append(write_queue.get_nowait())
+
+                results = []
+                try:
+                    async with self._async_db_engine.begin() as conn:
+                        for write_fn, future in writes:
+                            # A failed statement in SQLite doesn't abort the transaction, so
+                            # one failing write doesn't affect the rest of the group.
+                            try:
+                                results.append((future, await write_fn(conn), None))
+                            except Exception as e:
+                                results.append((future, None, e))
+                except Exception as e:
+                    logger.error("Failed to commit writes to DB.", error=str(e))
+                    results = [(future, None, e) for _, future in writes]
+
+                for future, result, error in results:
+                    # The caller may have been cancelled while waiting
+                    if future.done():
+                        continue
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+                writes = []
         finally:
-            await self._async_db_engine.dispose()
+            # Fail the writes that were not committed if the writer stops, so their
+            # callers don't wait forever.
+            while not write_queue.empty():
+                writes.append(write_queue.get_nowait())
+            for _, future in writes:
+                if not future.done():
+                    future.set_exception(RuntimeError("The DB writer was stopped."))
 
     async def _insert_pydantic_model(
-        self, model: BaseModel, sql_insert: text
+        self, model: BaseModel, sql_insert: text, conn: AsyncConnection
     ) -> Optional[BaseModel]:
         # There are create method in queries.py automatically generated by sqlc
         # However, the methods are buggy for Pydancti and don't work as expected.
         # Manually writing the SQL query to insert Pydantic models.
-        async with self._async_db_engine.begin() as conn:
-            try:
-                result = await conn.execute(sql_insert, model.model_dump())
-                row = result.first()
-                if row is None:
-                    return None
-
-                # Get the class of the Pydantic object to create a new object
-                model_class = model.__class__
-                return model_class(**row._asdict())
-            except Exception as e:
-                logger.error(f"Failed to insert model: {model}.", error=str(e))
+        try:
+            result = await conn.execute(sql_insert, model.model_dump())
+            row = result.first()
+            if row is None:
                 return None
 
-    async def record_request(self, prompt_params: Optional[Prompt] = None) -> Optional[Prompt]:
+            # Get the class of the Pydantic object to create a new object
+            model_class = model.__class__
+            return model_class(**row._asdict())
+        except Exception as e:
+            logger.error(f"Failed to insert model: {model}.", error=str(e))
+            return None
+
+    async def record_request(
+        self, prompt_params: Optional[Prompt] = None, conn: Optional[AsyncConnection] = None
+    ) -> Optional[Prompt]:
         if prompt_params is None:
             return None
+        if conn is None:
+            return await self._write(functools.partial(self.record_request, prompt_params))
         sql = text(
             """
                 INSERT INTO prompts (id, timestamp, provider, request, type)
@@ -112,29 +241,30 @@ class DbRecorder(DbCodeGate):
                 RETURNING *
                 """
         )
-        recorded_request = await self._insert_pydantic_model(prompt_params, sql)
+        recorded_request = await self._insert_pydantic_model(prompt_params, sql, conn)
         # Uncomment to debug the recorded request
         # logger.debug(f"Recorded request: {recorded_request}")
         return recorded_request
 
-    async def record_outputs(self, outputs: List[Output]) -> Optional[Output]:
+    async def record_outputs(
+        self, outputs: List[Output], conn: Optional[AsyncConnection] = None
+    ) -> Optional[Output]:
         if not outputs:
             return
+        if conn is None:
+            return await self._write(functools.partial(self.record_outputs, outputs))
 
         first_output = outputs[0]
         # Create a single entry on DB but encode all of the chunks in the stream as a list
         # of JSON objects in the field `output`
+        # The chunks are already serialized when added to the context, so just keep
+        # a reference to them and serialize the whole list once here.
         output_db = Output(
             id=first_output.id,
             prompt_id=first_output.prompt_id,
             timestamp=first_output.timestamp,
-            output=first_output.output,
+            output=orjson.dumps([output.output for output in outputs]).decode(),
         )
-        full_outputs = []
-        # Just store the model respnses in the list of JSON objects.
-        for output in outputs:
-            full_outputs.append(output.output)
-        output_db.output = json.dumps(full_outputs)
 
         sql = text(
             """
@@ -143,43 +273,36 @@ class DbRecorder(DbCodeGate):
                 RETURNING *
                 """
         )
-        recorded_output = await self._insert_pydantic_model(output_db, sql)
+        recorded_output = await self._insert_pydantic_model(output_db, sql, conn)
         logger.debug(f"Recorded output: {recorded_output}")
         return recorded_output
 
-    async def record_alerts(self, alerts: List[Alert]) -> List[Alert]:
+    async def record_alerts(
+        self, alerts: List[Alert], conn: Optional[AsyncConnection] = None
+    ) -> List[Alert]:
         if not alerts:
             return
-        sql = text(
-            """
-                INSERT INTO alerts (
-                id, prompt_id, code_snippet, trigger_string, trigger_type, trigger_category,
-                timestamp
-                )
-                VALUES (:id, :prompt_id, :code_snippet, :trigger_string, :trigger_type,
-                :trigger_category, :timestamp)
-                RETURNING *
-                """
-        )
-        # We can insert each alert independently in parallel.
-        alerts_tasks = []
-        async with asyncio.TaskGroup() as tg:
-            for alert in alerts:
-                try:
-                    result = tg.create_task(self._insert_pydantic_model(alert, sql))
-                    alerts_tasks.append(result)
-                except Exception as e:
-                    logger.error(f"Failed to record alert: {alert}.", error=str(e))
+        if conn is None:
+            recorded_alerts = await self._write(functools.partial(self.record_alerts, alerts))
+            await self._announce_critical_alerts(recorded_alerts)
+            return recorded_alerts
+        # Insert all the alerts with a single executemany of a compiled Core INSERT, which
+        # has no limit on the number of rows. The rows are stored as they are, so there's
+        # no need to read them back with RETURNING.
+        try:
+            await conn.execute(insert(_alerts_table), [alert.model_dump() for alert in alerts])
+        except Exception as e:
+            logger.error(f"Failed to record alerts: {alerts}.", error=str(e))
+            return []
 
-        recorded_alerts = []
-        for alert_coro in alerts_tasks:
-            alert_result = alert_coro.result()
-            recorded_alerts.append(alert_result)
-            if alert_result and alert_result.trigger_category == "critical":
-                await alert_queue.put(f"New alert detected: {alert.timestamp}")
+        logger.debug(f"Recorded alerts: {alerts}")
+        return alerts
 
-        logger.debug(f"Recorded alerts: {recorded_alerts}")
-        return recorded_alerts
+    async def _announce_critical_alerts(self, alerts: Optional[List[Alert]]) -> None:
+        """Notify the dashboard of the critical alerts. Only call it once they're committed."""
+        for alert in alerts or []:
+            if alert.trigger_category == "critical":
+                await alert_queue.put(f"New alert detected: {alert.timestamp}")
 
     def _should_record_context(self, context: Optional[PipelineContext]) -> bool:
         """Check if the context should be recorded in DB"""
@@ -200,9 +323,16 @@ class DbRecorder(DbCodeGate):
         try:
             if not self._should_record_context(context):
                 return
-            await self.record_request(context.input_request)
-            await self.record_outputs(context.output_responses)
-            await self.record_alerts(context.alerts_raised)
+
+            # The outputs are buffered in the context until the response finishes, so the
+            # prompt, its output and the alerts can be written in a single transaction.
+            async def write_context(conn: AsyncConnection) -> Optional[List[Alert]]:
+                await self.record_request(context.input_request, conn)
+                await self.record_outputs(context.output_responses, conn)
+                return await self.record_alerts(context.alerts_raised, conn)
+
+            recorded_alerts = await self._write(write_context)
+            await self._announce_critical_alerts(recorded_alerts)
             context.metadata["stored_in_db"] = True
             logger.info(
                 f"Recorded context in DB. Output chunks: {len(context.output_responses)}. "
@@ -217,19 +347,19 @@ class DbReader(DbCodeGate):
     def __init__(self, sqlite_path: Optional[str] = None):
         super().__init__(sqlite_path)
 
-    async def get_prompts_with_output(self) -> List[GetPromptWithOutputsRow]:
-        conn = await self._async_db_engine.connect()
-        querier = AsyncQuerier(conn)
-        prompts = [prompt async for prompt in querier.get_prompt_with_outputs()]
-        await conn.close()
-        return prompts
-
-    async def get_alerts_with_prompt_and_output(self) -> List[GetAlertsWithPromptAndOutputRow]:
-        conn = await self._async_db_engine.connect()
-        querier = AsyncQuerier(conn)
-        prompts = [prompt async for prompt in querier.get_alerts_with_prompt_and_output()]
-        await conn.close()
-        return prompts
+    async def get_prompts_with_output(self) -> AsyncIterator[GetPromptWithOutputsRow]:
+        async with self._async_db_engine.connect() as conn:
+            querier = AsyncQuerier(conn)
+            async for prompt in querier.get_prompt_with_outputs():
+                yield prompt
+
+    async def get_alerts_with_prompt_and_output(
+        self,
+    ) -> AsyncIterator[GetAlertsWithPromptAndOutputRow]:
+        async with self._async_db_engine.connect() as conn:
+            querier = AsyncQuerier(conn)
+            async for alert in querier.get_alerts_with_prompt_and_output():
+                yield alert
 
 
 def init_db_sync(db_path: Optional[str] = None):
@@ -20,7 +20,9 @@ class LlamaCppInferenceEngine:
         return cls.__inference_engine
 
     def __init__(self):
-        if not hasattr(self, "models"):
+        # __init__ runs every time the singleton is requested. Check the name-mangled attribute
+        # so the loaded models are kept instead of being reloaded on the next call.
+        if not hasattr(self, "_LlamaCppInferenceEngine__models"):
             self.__models = {}
 
     def __del__(self):
@@ -1,12 +1,11 @@
-import dataclasses
 import datetime
-import json
 import uuid
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from enum import Enum
 from typing import Any, Dict, List, Optional
 
+import orjson
 import structlog
 from litellm import ChatCompletionRequest, ModelResponse
 from pydantic import BaseModel
@@ -102,7 +101,8 @@ class PipelineContext:
             logger.warning("No code snippet or trigger string provided for alert. Will not create")
             return
 
-        code_snippet_str = json.dumps(dataclasses.asdict(code_snippet)) if code_snippet else None
+        # orjson serializes dataclasses natively, without the deep copy done by asdict()
+        code_snippet_str = orjson.dumps(code_snippet).decode() if code_snippet else None
 
         self.alerts_raised.append(
             Alert(
@@ -124,7 +124,7 @@ class PipelineContext:
             if self.prompt_id is None:
                 self.prompt_id = str(uuid.uuid4())
 
-            request_str = json.dumps(normalized_request)
+            request_str = orjson.dumps(normalized_request, option=orjson.OPT_NON_STR_KEYS).decode()
 
             self.input_request = Prompt(
                 id=self.prompt_id,
@@ -144,10 +144,11 @@ class PipelineContext:
                 logger.warning(f"Tried to record output without response: {model_response}")
                 return
 
+            # model_dump_json is already serialized natively by pydantic-core
             if isinstance(model_response, BaseModel):
                 output_str = model_response.model_dump_json(exclude_none=True, exclude_unset=True)
             else:
-                output_str = json.dumps(model_response)
+                output_str = orjson.dumps(model_response, option=orjson.OPT_NON_STR_KEYS).decode()
 
             self.output_responses.append(
                 Output(
@@ -85,6 +85,10 @@ class OutputPipelineInstance:
         # the remaining content in the buffer when the stream ends, we need
         # to store the parameters like model, timestamp, etc.
         self._buffered_chunk = None
+        # Streams should share the recorder of their provider. The instance closes the
+        # recorder it creates itself once the context is recorded, so its writer doesn't
+        # outlive the stream.
+        self._owns_db_recorder = not db_recorder
         if not db_recorder:
             self._db_recorder = DbRecorder()
         else:
@@ -113,6 +117,8 @@ class OutputPipelineInstance:
 
     async def _record_to_db(self):
         await self._db_recorder.record_context(self._input_context)
+        if self._owns_db_recorder:
+            await self._db_recorder.close()
 
     async def process_stream(
         self, stream: AsyncIterator[ModelResponse]
@@ -96,6 +96,7 @@ class BaseProvider(ABC):
         output_pipeline_instance = OutputPipelineInstance(
             pipeline_steps=out_pipeline_processor.pipeline_steps,
             input_context=input_context,
+            db_recorder=self._db_recorder,
         )
         pipeline_output_stream = output_pipeline_instance.process_stream(normalized_stream)
         denormalized_stream = self._output_normalizer.denormalize_streaming(pipeline_output_stream)
@@ -1,31 +1,31 @@
 from urllib.parse import quote
 
+PACKAGE_TYPE_DESCRIPTIONS = {
+    "pypi": "Python package available on PyPI ecosystem",
+    "npm": "JavaScript package available on NPM ecosystem",
+    "go": "Go package ecosystem",
+    "crates": "Rust package available on Crates ecosystem",
+    "java": "Java package available on Maven ecosystem",
+}
+PACKAGE_STATUS_MESSAGES = {
+    "archived": "However, this package is found to be archived and no longer maintained.",
+    "deprecated": "However, this package is found to be deprecated and no longer "
+    "recommended for use.",
+    "malicious": "However, this package is found to be malicious and must not be used.",
+}
+
 
 def generate_vector_string(package) -> str:
-    vector_str = f"{package['name']}"
-    package_url = ""
-    type_map = {
-        "pypi": "Python package available on PyPI ecosystem",
-        "npm": "JavaScript package available on NPM ecosystem",
-        "go": "Go package ecosystem",
-        "crates": "Rust package available on Crates ecosystem",
-        "java": "Java package available on Maven ecosystem",
-    }
-    status_messages = {
-        "archived": "However, this package is found to be archived and no longer maintained.",
-        "deprecated": "However, this package is found to be deprecated and no longer "
-        "recommended for use.",
-        "malicious": "However, this package is found to be malicious and must not be used.",
-    }
-    vector_str += f" is a {type_map.get(package['type'], 'package of unknown type')}. "
-    package_name = quote(package["name"], safe="")
-    package_url = f"https://www.insight.stacklok.com/report/{package['type']}/{package_name}"
+    package_type = package["type"]
+    type_description = PACKAGE_TYPE_DESCRIPTIONS.get(package_type, "package of unknown type")
+    vector_str = f"{package['name']} is a {type_description}. "
 
     # Add extra status
-    status_suffix = status_messages.get(package["status"], "")
+    status_suffix = PACKAGE_STATUS_MESSAGES.get(package["status"], "")
     if status_suffix:
+        package_name = quote(package["name"], safe="")
+        package_url = f"https://www.insight.stacklok.com/report/{package_type}/{package_name}"
         vector_str += f" {status_suffix} For additional information refer to {package_url}"
 
     # add description
-    vector_str += f" - Package offers this functionality: {package['description']}"
-    return vector_str
+    return f"{vector_str} - Package offers this functionality: {package['description']}"
@@ -0,0 +1,215 @@
+import asyncio
+import datetime
+import json
+import uuid
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, text
+
+from codegate.db.connection import DbReader, DbRecorder, alert_queue
+from codegate.db.models import Alert, Output, Prompt
+from codegate.pipeline.base import PipelineContext
+
+
+@pytest_asyncio.fixture
+async def db_recorder(tmp_path):
+    # DbRecorder creates the schema with asyncio.run, so build it outside the running loop
+    recorder = await asyncio.to_thread(DbRecorder, str(tmp_path / "codegate.db"))
+    yield recorder
+    # Stop the writer task before the test's event loop is closed
+    await recorder.close()
+
+
+def _create_alert(prompt_id: str, trigger_category: str) -> Alert:
+    return Alert(
+        id=str(uuid.uuid4()),
+        prompt_id=prompt_id,
+        code_snippet=None,
+        trigger_string="trigger",
+        trigger_type="test-step",
+        trigger_category=trigger_category,
+        timestamp=datetime.datetime.now(datetime.timezone.utc),
+    )
+
+
+def _create_prompt() -> Prompt:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return Prompt(id=str(uuid.uuid4()), timestamp=now, provider="openai", request="{}", type="chat")
+
+
+def _create_context(prompt_id: str, outputs: list[str]) -> PipelineContext:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return PipelineContext(
+        prompt_id=prompt_id,
+        input_request=Prompt(
+            id=prompt_id, timestamp=now, provider="openai", request="{}", type="chat"
+        ),
+        output_responses=[
+            Output(id=str(uuid.uuid4()), prompt_id=prompt_id, timestamp=now, output=output)
+            for output in outputs
+        ],
+        alerts_raised=[_create_alert(prompt_id, "info")],
+    )
+
+
+async def _fetch_all(db_recorder: DbRecorder, sql: str):
+    async with db_recorder._async_db_engine.connect() as conn:
+        result = await conn.execute(text(sql))
+        return result.fetchall()
+
+
+@pytest.mark.asyncio
+async def test_record_alerts(db_recorder):
+    prompt_id = str(uuid.uuid4())
+    alerts = [
+        _create_alert(prompt_id, "info"),
+        _create_alert(prompt_id, "critical"),
+        _create_alert(prompt_id, "info"),
+    ]
+
+    recorded = await db_recorder.record_alerts(alerts)
+
+    assert recorded == alerts
+    rows = await _fetch_all(db_recorder, "SELECT id FROM alerts")
+    assert sorted(row[0] for row in rows) == sorted(alert.id for alert in alerts)
+    # Only the critical alert is notified
+    assert alert_queue.qsize() == 1
+    alert_queue.get_nowait()
+
+
+@pytest.mark.asyncio
+async def test_record_alerts_empty(db_recorder):
+    assert await db_recorder.record_alerts([]) is None
+    assert await _fetch_all(db_recorder, "SELECT id FROM alerts") == []
+
+
+@pytest.mark.asyncio
+async def test_sqlite_pragmas(db_recorder):
+    assert await _fetch_all(db_recorder, "PRAGMA journal_mode") == [("wal",)]
+    # 1 is NORMAL
+    assert await _fetch_all(db_recorder, "PRAGMA synchronous") == [(1,)]
+
+
+@pytest.mark.asyncio
+async def test_record_context(db_recorder):
+    prompt_id = str(uuid.uuid4())
+    context = _create_context(prompt_id, ['"a"', '"b"'])
+
+    await db_recorder.record_context(context)
+
+    assert context.metadata["stored_in_db"]
+    assert await _fetch_all(db_recorder, "SELECT id FROM prompts") == [(prompt_id,)]
+    outputs = await _fetch_all(db_recorder, "SELECT prompt_id, output FROM outputs")
+    assert len(outputs) == 1
+    assert outputs[0][0] == prompt_id
+    # All the chunks are stored in a single row as a JSON list
+    assert json.loads(outputs[0][1]) == ['"a"', '"b"']
+    alerts = await _fetch_all(db_recorder, "SELECT prompt_id FROM alerts")
+    assert alerts == [(prompt_id,)]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_are_grouped(db_recorder):
+    commits = []
+    event.listen(db_recorder._async_db_engine.sync_engine, "commit", lambda conn: commits.append(1))
+    now = datetime.datetime.now(datetime.timezone.utc)
+    prompts = [
+        Prompt(id=str(uuid.uuid4()), timestamp=now, provider="openai", request="{}", type="chat")
+        for _ in range(10)
+    ]
+
+    recorded = await asyncio.gather(*[db_recorder.record_request(prompt) for prompt in prompts])
+
+    assert [prompt.id for prompt in recorded] == [prompt.id for prompt in prompts]
+    rows = await _fetch_all(db_recorder, "SELECT id FROM prompts")
+    assert sorted(row[0] for row in rows) == sorted(prompt.id for prompt in prompts)
+    # All the writes queued together are committed in a single transaction
+    assert len(commits) == 1
+
+
+@pytest.mark.asyncio
+async def test_close_stops_writer(db_recorder):
+    await db_recorder.record_request(_create_prompt())
+    writer_task = db_recorder._writer_task
+
+    await db_recorder.close()
+
+    assert writer_task.done()
+    # The recorder can still be used after closing it
+    prompt = _create_prompt()
+    assert (await db_recorder.record_request(prompt)).id == prompt.id
+
+
+@pytest.mark.asyncio
+async def test_writer_restarts_after_it_stopped(db_recorder):
+    await db_recorder.record_request(_create_prompt())
+    db_recorder._writer_task.cancel()
+    await asyncio.wait([db_recorder._writer_task])
+
+    prompt = _create_prompt()
+    recorded = await asyncio.wait_for(db_recorder.record_request(prompt), timeout=5)
+
+    assert recorded.id == prompt.id
+
+
+@pytest.mark.asyncio
+async def test_alerts_not_announced_if_commit_fails(db_recorder):
+    def fail_commit(conn):
+        raise RuntimeError("commit failed")
+
+    event.listen(db_recorder._async_db_engine.sync_engine, "commit", fail_commit)
+    prompt_id = str(uuid.uuid4())
+    context = _create_context(prompt_id, ['"a"'])
+    context.alerts_raised = [_create_alert(prompt_id, "critical")]
+
+    await db_recorder.record_context(context)
+
+    assert not context.metadata.get("stored_in_db", False)
+    assert alert_queue.empty()
+
+
+def test_writer_restarts_on_new_event_loop(tmp_path):
+    # The recorder may be called from different event loops, each of them needs its own
+    # writer task.
+    db_recorder = DbRecorder(str(tmp_path / "codegate.db"))
+    now = datetime.datetime.now(datetime.timezone.utc)
+    prompts = [
+        Prompt(id=str(uuid.uuid4()), timestamp=now, provider="openai", request="{}", type="chat")
+        for _ in range(2)
+    ]
+
+    for prompt in prompts:
+        assert asyncio.run(db_recorder.record_request(prompt)).id == prompt.id
+
+    rows = asyncio.run(_fetch_all(db_recorder, "SELECT id FROM prompts"))
+    assert sorted(row[0] for row in rows) == sorted(prompt.id for prompt in prompts)
+
+
+@pytest.mark.asyncio
+async def test_db_reader(db_recorder):
+    prompt_id = str(uuid.uuid4())
+    context = _create_context(prompt_id, ['"a"'])
+    await db_recorder.record_context(context)
+    db_reader = DbReader(str(db_recorder._db_path))
+
+    prompts = [prompt async for prompt in db_reader.get_prompts_with_output()]
+    alerts = [alert async for alert in db_reader.get_alerts_with_prompt_and_output()]
+
+    assert [(prompt.id, prompt.output_id) for prompt in prompts] == [
+        (prompt_id, context.output_responses[0].id)
+    ]
+    assert [(alert.id, alert.prompt_id) for alert in alerts] == [
+        (context.alerts_raised[0].id, prompt_id)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_record_many_alerts(db_recorder):
+    # 40000 alerts x 7 columns need more bound parameters than a single statement allows,
+    # both with SQLite's default limit of 32766 and the 250000 some distributions build with
+    prompt_id = str(uuid.uuid4())
+    alerts = [_create_alert(prompt_id, "info") for _ in range(40000)]
+
+    assert await db_recorder.record_alerts(alerts) == alerts
+    assert await _fetch_all(db_recorder, "SELECT COUNT(*) FROM alerts") == [(40000,)]
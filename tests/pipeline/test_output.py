@@ -1,5 +1,5 @@
 from typing import List
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from litellm import ModelResponse
@@ -314,3 +314,24 @@ class TestOutputPipelineInstance:
         assert chunks[0].choices[0].delta.content == "HelloWorld"
         # Buffer should be cleared after flush
         assert len(instance._context.buffer) == 0
+
+    @pytest.mark.asyncio
+    async def test_closes_own_db_recorder(self):
+        """Test that the recorder created by the instance is closed after recording"""
+        with patch("codegate.pipeline.output.DbRecorder") as mock_db_recorder:
+            mock_db_recorder.return_value = AsyncMock()
+            instance = OutputPipelineInstance([], MockContext())
+            await instance._record_to_db()
+
+        mock_db_recorder.return_value.record_context.assert_awaited_once()
+        mock_db_recorder.return_value.close.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_keeps_shared_db_recorder_open(self):
+        """Test that a recorder passed to the instance is left open for other streams"""
+        db_recorder = AsyncMock()
+        instance = OutputPipelineInstance([], MockContext(), db_recorder)
+        await instance._record_to_db()
+
+        db_recorder.record_context.assert_awaited_once()
+        db_recorder.close.assert_not_awaited()
@@ -0,0 +1,28 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from codegate.inference.inference_engine import LlamaCppInferenceEngine
+
+
+@pytest.fixture
+def fresh_engine(monkeypatch):
+    # Start from a new singleton so models loaded by other tests aren't reused
+    monkeypatch.setattr(LlamaCppInferenceEngine, "_LlamaCppInferenceEngine__inference_engine", None)
+
+
+@pytest.mark.asyncio
+async def test_model_is_loaded_once_across_instances(fresh_engine):
+    """
+    Requesting the singleton again must keep the models that were already loaded
+    """
+    with patch("codegate.inference.inference_engine.Llama") as mock_llama:
+        mock_llama.return_value = MagicMock(embed=MagicMock(return_value=[[0.1, 0.2]]))
+
+        engine = LlamaCppInferenceEngine()
+        assert await engine.embed("model.gguf", ["content"]) == [[0.1, 0.2]]
+
+        assert LlamaCppInferenceEngine() is engine
+        assert await engine.embed("model.gguf", ["more content"]) == [[0.1, 0.2]]
+
+    mock_llama.assert_called_once()